@@ -1,22 +1,140 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pacsv
 import time
-import math
-from datetime import datetime
-from backend import init_connection, add_item, update_stock, get_inventory_df, get_transactions_df, get_top_selling_items, delete_item, update_item_details, get_setting, set_setting, process_batch_transaction, update_live_cart, get_live_cart, clear_live_cart, get_eastern_time
+import hmac
+import html
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from backend import init_connection, add_item, get_inventory_df, get_inventory_version, get_transactions_df, get_transaction_count, get_inventory_stats, get_low_stock_df, get_inventory_total_value, get_log_flush_count, delete_item, update_item_details, get_setting, set_setting, process_batch_transaction, update_live_cart, schedule_live_cart, get_live_cart, get_eastern_time
 
 # Page Config
 st.set_page_config(page_title="Inventory Manager (Supabase)", layout="wide", page_icon="⚡")
 
+# Alternating row colors (White / Light Blue) via one CSS rule instead of a per-row pandas Styler
+st.markdown("<style>div[data-testid='stDataFrame'] tbody tr:nth-child(even){background:#e6f3ff}</style>", unsafe_allow_html=True)
+
 # Initialize DB connection (cached)
 try:
     init_connection()
 except Exception as e:
     st.error(f"Failed to connect to database: {e}")
 
-# Initialize Session State for Cart
+# Initialize Session State for Cart (line_id -> item, insertion ordered)
 if "cart" not in st.session_state:
-    st.session_state["cart"] = []
+    st.session_state["cart"] = {}
+
+
+# --- Data Caching ---
+# Columns the POS search, scan and cart actually read
+POS_COLUMNS = ('id', 'name', 'color', 'barcode', 'quantity', 'price', 'sale_percent', 'bogo')
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _cached_inventory():
+    return get_inventory_df()
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _cached_pos_inventory(version=None):
+    """POS inventory plus its search label -> id and barcode -> row maps, rebuilt only when the inventory is refetched."""
+    df = get_inventory_df(POS_COLUMNS)
+    if df.empty:
+        return df, {}, {}
+    label_to_id = dict(zip(build_item_labels(df), df['id'].astype(int)))
+    # First row wins for duplicate barcodes, as the old column scan did
+    barcodes = df['barcode'].fillna('').astype(str)
+    first = (barcodes != '') & ~barcodes.duplicated()
+    barcode_to_pos = dict(zip(barcodes[first], np.flatnonzero(first.to_numpy(dtype=bool))))
+    return df, label_to_id, barcode_to_pos
+
+@st.cache_data(ttl=2, show_spinner=False)
+def _cached_inventory_version():
+    """The inventory change counter, re-asked at most every couple of seconds rather than on every rerun."""
+    return get_inventory_version()
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _cached_transactions(limit=100, offset=0, log_version=None):
+    """log_version (get_log_flush_count()) only keys the cache, so rows logged in the background show up once flushed."""
+    return get_transactions_df(limit=limit, offset=offset)
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _cached_transaction_count(log_version=None):
+    return get_transaction_count()
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _cached_inventory_stats():
+    return get_inventory_stats()
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _cached_low_stock():
+    return get_low_stock_df()
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _cached_total_value():
+    return get_inventory_total_value()
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _cached_setting(key, default=None):
+    # Raises on read errors: st.cache_data doesn't cache exceptions, so a failed read isn't remembered
+    return get_setting(key, default, raise_errors=True)
+
+def _to_csv_bytes(df):
+    """Encode a DataFrame as CSV bytes with Arrow's C writer (no intermediate str)."""
+    buf = pa.BufferOutputStream()
+    pacsv.write_csv(pa.Table.from_pandas(df, preserve_index=False), buf)
+    return buf.getvalue().to_pybytes()
+
+def fetch_parallel(*calls):
+    """Run independent zero-argument fetches concurrently; results come back in call order."""
+    with ThreadPoolExecutor(max_workers=min(len(calls), 4)) as pool:
+        futures = [pool.submit(call) for call in calls]
+        return [future.result() for future in futures]
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _export_csvs():
+    """Inventory and transactions CSV bytes for the Settings exports, fetched side by side.
+    Fetch errors propagate (st.error from a worker thread would be dropped) so a failure is never cached."""
+    inventory_df, transactions_df = fetch_parallel(
+        lambda: get_inventory_df(raise_errors=True),
+        lambda: get_transactions_df(limit=10000, raise_errors=True),
+    )
+    return _to_csv_bytes(inventory_df), _to_csv_bytes(transactions_df)
+
+def _pos_inventory():
+    """POS inventory and lookup maps, reused across reruns until the DB inventory version changes."""
+    version = _cached_inventory_version()
+    if version is None: # inventory_version() not installed: rely on the TTL cache
+        return _cached_pos_inventory()
+    cached = st.session_state.get("_pos_inventory")
+    if cached is None or cached[0] != version:
+        cached = (version, _cached_pos_inventory(version))
+        st.session_state["_pos_inventory"] = cached
+    return cached[1]
+
+def _session_setting(key, default=None):
+    """Read a setting once per session; later reruns skip even the cache lookup.
+    If the read fails, default is used for this call only and the next call tries again."""
+    state_key = f"_setting_{key}"
+    if state_key not in st.session_state:
+        try:
+            st.session_state[state_key] = _cached_setting(key, default)
+        except Exception as e:
+            print(f"⚠️ Could not read setting '{key}', using the default for now: {e}")
+            return default
+    return st.session_state[state_key]
+
+def invalidate_data_cache():
+    """Drop cached inventory/transactions after a write so the next rerun refetches."""
+    _cached_inventory.clear()
+    _cached_pos_inventory.clear()
+    _cached_transactions.clear()
+    _cached_transaction_count.clear()
+    _cached_inventory_stats.clear()
+    _cached_inventory_version.clear()
+    _cached_low_stock.clear()
+    _cached_total_value.clear()
+    _export_csvs.clear()
 
 
 # --- Helper: Price Calculation ---
@@ -29,20 +147,37 @@ def get_effective_price(price, sale_percent):
 def get_bogo_paid_qty(qty, bogo):
     """Calculate how many units to charge for (BOGO: buy 2 pay 1)."""
     if bogo and qty >= 2:
-        return math.ceil(qty / 2)
+        return (qty + 1) // 2
     return qty
 
+def promo_pricing(price, sale_pct, qty, bogo):
+    """Array form of get_effective_price + get_bogo_paid_qty: (effective price, paid qty) per line.
+    Shared by the cart totals, the POS cart table and the Customer View so they can't disagree."""
+    effective_price = np.where(sale_pct > 0, price * (1 - sale_pct / 100), price)
+    paid_qty = np.where(bogo & (qty >= 2), (qty + 1) // 2, qty)
+    return effective_price, paid_qty
+
+def cart_pricing_frame(items):
+    """Cart items as a DataFrame with normalized qty/price/sale_pct/bogo plus eff_price and paid_qty."""
+    df = pd.DataFrame(items)
+    df['qty'] = df['qty'].astype(int)
+    df['price'] = df['price'].astype(float)
+    df['sale_pct'] = df['sale_percent'].fillna(0).astype(int) if 'sale_percent' in df.columns else 0
+    df['bogo'] = df['bogo'].fillna(False).astype(bool) if 'bogo' in df.columns else False
+    eff_price, paid_qty = promo_pricing(df['price'].to_numpy(), df['sale_pct'].to_numpy(), df['qty'].to_numpy(), df['bogo'].to_numpy())
+    df['eff_price'] = eff_price
+    df['paid_qty'] = paid_qty
+    return df
+
 def calculate_cart_totals(cart_items, checkout_discount_pct=0):
-    """Calculate all cart totals with promotions."""
-    subtotal = 0
-    for item in cart_items:
-        price = item['price']
-        sale_pct = item.get('sale_percent', 0)
-        effective_price = get_effective_price(price, sale_pct)
-        bogo = item.get('bogo', False)
-        paid_qty = get_bogo_paid_qty(item['qty'], bogo)
-        item_total = effective_price * paid_qty
-        subtotal += item_total
+    """Calculate all cart totals with promotions (one array pass instead of per-item calls)."""
+    n = len(cart_items)
+    price = np.fromiter((item['price'] for item in cart_items), float, n)
+    sale_pct = np.fromiter((item.get('sale_percent') or 0 for item in cart_items), float, n)
+    qty = np.fromiter((item['qty'] for item in cart_items), np.int64, n)
+    bogo = np.fromiter((bool(item.get('bogo', False)) for item in cart_items), bool, n)
+    effective_price, paid_qty = promo_pricing(price, sale_pct, qty, bogo)
+    subtotal = float((effective_price * paid_qty).sum())
     
     discount_amount = subtotal * (checkout_discount_pct / 100)
     final_total = subtotal - discount_amount
@@ -51,81 +186,148 @@ def calculate_cart_totals(cart_items, checkout_discount_pct=0):
 
 
 # --- POS Helper to Sync ---
-def sync_cart():
+def sync_cart(debounce=False):
+    """Push the cart to the Customer Display. With debounce, the write is scheduled and
+    coalesced with any other changes in the next LIVE_CART_DELAY_SECONDS."""
     if "cart" in st.session_state:
         # Defaults to 0 if not set
         disc_val = st.session_state.get("checkout_discount", 0) 
-        sub, disc_amt, final = calculate_cart_totals(st.session_state["cart"], disc_val)
+        items = list(st.session_state["cart"].values())
+        sub, disc_amt, final = calculate_cart_totals(items, disc_val)
         cart_data = {
-            "items": st.session_state["cart"],
+            "items": items,
             "subtotal": sub,
             "discount": disc_amt,
             "total": final
         }
-        update_live_cart(cart_data)
+        if debounce:
+            schedule_live_cart(cart_data)
+        else:
+            update_live_cart(cart_data)
+
+def cart_fingerprint(cart_data):
+    """Cheap, comparable summary of everything the Customer View shows for a live cart."""
+    if not cart_data:
+        return None
+    return (
+        cart_data.get("subtotal"), cart_data.get("discount"), cart_data.get("total"),
+        tuple((i.get('id'), i.get('name'), i.get('qty'), i.get('price'), i.get('sale_percent', 0), i.get('bogo', False)) for i in cart_data.get("items") or ())
+    )
 
 # --- UI Helpers ---
-def style_dataframe(df):
-    """Applies alternating row colors (White / Light Blue) to a dataframe."""
-    def highlight_rows(row):
-        return ['background-color: #e6f3ff' if row.name % 2 != 0 else 'background-color: #ffffff' for _ in row]
-    
-    df = df.reset_index(drop=True)
-    return df.style.apply(highlight_rows, axis=1)
+def build_item_labels(df):
+    """Builds the POS search labels (name | (color) | barcode | promo | stock) column-wise."""
+    sep = " | "
+    labels = df['name'].astype(str)
+    if 'color' in df.columns:
+        color = df['color'].fillna('').astype(str)
+        labels = labels.where(color == '', labels + sep + "(" + color + ")")
+    if 'barcode' in df.columns:
+        barcode = df['barcode'].fillna('').astype(str)
+        labels = labels.where(barcode == '', labels + sep + barcode)
+    # Promo badges
+    sale_pct = df['sale_percent']
+    on_sale = sale_pct > 0
+    if on_sale.any():
+        price = df['price'].astype(float)
+        eff_price = price * (1 - sale_pct / 100)
+        promo = "🔥" + sale_pct.astype(str) + "%OFF $" + price.map("{:.2f}".format) + "→$" + eff_price.map("{:.2f}".format)
+        labels = labels.where(~on_sale, labels + sep + promo)
+    labels = labels.where(~df['bogo'], labels + sep + "🎁BOGO")
+    return labels + sep + "Stock: " + df['quantity'].astype(str)
 
-def generate_receipt_html(cart_items, subtotal, discount_pct, discount_amount, final_total, receipt_id, auto_print=False):
-    """Generates a simple HTML receipt with promotion info."""
-    date_str = get_eastern_time().strftime("%Y-%m-%d %H:%M:%S")
-    
-    rows_html = ""
-    for item in cart_items:
-        price = item['price']
-        sale_pct = item.get('sale_percent', 0)
-        effective_price = get_effective_price(price, sale_pct)
-        bogo = item.get('bogo', False)
-        qty = item['qty']
-        paid_qty = get_bogo_paid_qty(qty, bogo)
-        item_total = effective_price * paid_qty
-        
-        # Build promo tags
-        promo_tags = ""
-        if sale_pct and sale_pct > 0:
-            promo_tags += f' <small style="color:red;">(-{sale_pct}%)</small>'
-        if bogo and qty >= 2:
-            free_qty = qty - paid_qty
-            promo_tags += f' <small style="color:green;">({free_qty} FREE)</small>'
-        
-        # Price display
-        if sale_pct and sale_pct > 0:
-            price_display = f'<s>${price:.2f}</s> ${effective_price:.2f}'
-        else:
-            price_display = f'${effective_price:.2f}'
-        
-        rows_html += f"""
+def build_customer_table(items):
+    """Builds the Customer View rows (Item, Price, Qty, Promos, Total) column-wise."""
+    df = cart_pricing_frame(items)
+    qty, price, sale_pct, bogo, eff_price, paid_qty = (df[c] for c in ('qty', 'price', 'sale_pct', 'bogo', 'eff_price', 'paid_qty'))
+    on_sale = sale_pct > 0
+    sale_tag = ("🔥 -" + sale_pct.astype(str) + "%").where(on_sale, "")
+    bogo_tag = ("🎁 " + (qty - paid_qty).astype(str) + " FREE").where(bogo, "")
+    return pd.DataFrame({
+        "Item": df['name'],
+        "Price": "$" + eff_price.map("{:.2f}".format) + (" (Reg: $" + price.map("{:.2f}".format) + ")").where(on_sale, ""),
+        "Qty": qty,
+        "Promos": (sale_tag + " " + bogo_tag).str.strip(),
+        "Total": "$" + (eff_price * paid_qty).map("{:.2f}".format),
+    })
+
+def build_cart_table(cart_items):
+    """Builds the POS cart rows (Name, Qty, Price, Promos, Total, Note) column-wise."""
+    df = cart_pricing_frame(cart_items)
+    qty, price, sale_pct, bogo, eff_price, paid_qty = (df[c] for c in ('qty', 'price', 'sale_pct', 'bogo', 'eff_price', 'paid_qty'))
+    on_sale = sale_pct > 0
+    free_bogo = bogo & (qty >= 2)
+    sale_tag = ("🔥-" + sale_pct.astype(str) + "% ").where(on_sale, "")
+    bogo_tag = ("🎁" + (qty - paid_qty).astype(str) + " FREE ").where(free_bogo, "")
+    return pd.DataFrame({
+        "Name": df['name'],
+        "Qty": qty,
+        "Price": "$" + eff_price.map("{:.2f}".format) + (" (was $" + price.map("{:.2f}".format) + ")").where(on_sale, ""),
+        "Promos": (sale_tag + bogo_tag).str.strip(),
+        "Total": eff_price * paid_qty,
+        "Note": df['note'].fillna('') if 'note' in df.columns else "",
+    })
+
+def customer_table_html(df):
+    """Renders the Customer View rows as a plain HTML table; row striping is left to CSS."""
+    head = "".join(f"<th>{col}</th>" for col in df.columns)
+    # One <tr> per row, every cell escaped
+    rows = "".join(
+        "<tr>" + "".join(f"<td>{_esc(value)}</td>" for value in row) + "</tr>"
+        for row in df.itertuples(index=False, name=None)
+    )
+    return f"<table class='cust-table'><thead><tr>{head}</tr></thead><tbody>{rows}</tbody></table>"
+
+# --- Customer View Styles (built once at import) ---
+CUSTOMER_VIEW_CSS = """
+        <style>
+            [data-testid="stSidebar"], [data-testid="stHeader"], footer {display: none;}
+            
+            /* Large Fonts */
+            .cust-item-name { font-size: 2.0rem !important; font-weight: bold; color: #333; }
+            .cust-item-detail { font-size: 2.0rem !important; color: #555; }
+            .cust-promo { font-size: 1.5rem !important; color: #d9534f; font-weight: bold; }
+            
+            /* Totals Box */
+            .total-box { 
+                background-color: #d1ecf1; 
+                padding: 30px; 
+                border-radius: 15px; 
+                text-align: right; 
+                margin-top: 30px;
+                border: 2px solid #bee5eb;
+            }
+            .total-label { font-size: 1.8rem !important; color: #0c5460; }
+            .total-amt { font-size: 3.2rem !important; font-weight: 800; color: #000; }
+            
+            /* Cart Table */
+            .cust-table { width: 100%; border-collapse: collapse; font-size: 1.6rem; }
+            .cust-table th { text-align: left; color: #0c5460; border-bottom: 2px solid #bee5eb; padding: 10px; }
+            .cust-table td { padding: 10px; }
+            .cust-table tbody tr:nth-child(even) { background: #e6f3ff; }
+        </style>
+    """
+
+# --- Receipt Templates (built once at import) ---
+_RECEIPT_ROW_TEMPLATE = """
         <tr>
-            <td>{item['name']}{promo_tags}</td>
+            <td>{name}{promo_tags}</td>
             <td>{qty}</td>
             <td>{price_display}</td>
             <td>${item_total:.2f}</td>
         </tr>
         """
-    
-    # Discount line
-    discount_html = ""
-    if discount_pct > 0:
-        discount_html = f"""
+
+_RECEIPT_DISCOUNT_TEMPLATE = """
         <p class="right">Subtotal: ${subtotal:.2f}</p>
         <p class="right" style="color:red;">Discount ({discount_pct}%): -${discount_amount:.2f}</p>
         """
-        
-    auto_print_script = "<script>window.onload = function() { window.print(); }</script>" if auto_print else ""
 
-    def get_receipt_body(copy_type):
-        return f"""
+_RECEIPT_BODY_TEMPLATE = """
         <div class="receipt-container">
             <div class="header">
                 <h3>Inventory Store</h3>
-                <p>Receipt ID: {receipt_id[:8]}</p>
+                <p>Receipt ID: {receipt_id}</p>
                 <p>{date_str}</p>
                 <p><strong>*** {copy_type} ***</strong></p>
             </div>
@@ -147,8 +349,10 @@ def generate_receipt_html(cart_items, subtotal, discount_pct, discount_amount, f
             </div>
         </div>
         """
+# Split around the copy label so a receipt formats its body once for both copies
+_RECEIPT_BODY_HEAD, _RECEIPT_BODY_TAIL = _RECEIPT_BODY_TEMPLATE.split("{copy_type}")
 
-    html = f"""
+_RECEIPT_DOC_TEMPLATE = """
     <html>
     <head>
         <title>Receipt</title>
@@ -179,26 +383,99 @@ def generate_receipt_html(cart_items, subtotal, discount_pct, discount_amount, f
         {auto_print_script}
     </head>
     <body>
-        {get_receipt_body("CUSTOMER COPY")}
+        {customer_body}
         
         <!-- Page Break for Receipt Printer (Triggers Cut) -->
         <div class="page-break"></div>
         
-        {get_receipt_body("MERCHANT COPY")}
+        {merchant_body}
     </body>
     </html>
     """
-    return html
+
+_HTML_SPECIAL = frozenset('<>&"\'')
+
+def _esc(text):
+    """HTML-escapes text, returning it untouched when it has no special characters."""
+    text = str(text)
+    return text if _HTML_SPECIAL.isdisjoint(text) else html.escape(text, quote=True)
+
+def _receipt_row_html(item):
+    """Renders one receipt table row with promotion tags."""
+    price = item['price']
+    sale_pct = item.get('sale_percent', 0)
+    effective_price = get_effective_price(price, sale_pct)
+    bogo = item.get('bogo', False)
+    qty = item['qty']
+    paid_qty = get_bogo_paid_qty(qty, bogo)
+    
+    # Build promo tags
+    promo_tags = ""
+    if sale_pct and sale_pct > 0:
+        promo_tags += f' <small style="color:red;">(-{sale_pct}%)</small>'
+    if bogo and qty >= 2:
+        free_qty = qty - paid_qty
+        promo_tags += f' <small style="color:green;">({free_qty} FREE)</small>'
+    
+    # Price display
+    if sale_pct and sale_pct > 0:
+        price_display = f'<s>${price:.2f}</s> ${effective_price:.2f}'
+    else:
+        price_display = f'${effective_price:.2f}'
+    
+    return _RECEIPT_ROW_TEMPLATE.format(
+        name=_esc(item['name']),
+        promo_tags=promo_tags,
+        qty=qty,
+        price_display=price_display,
+        item_total=effective_price * paid_qty
+    )
+
+def generate_receipt_html(cart_items, subtotal, discount_pct, discount_amount, final_total, receipt_id, auto_print=False, sold_at=None):
+    """Generates a simple HTML receipt with promotion info (dated sold_at, default now)."""
+    fields = {
+        "receipt_id": receipt_id[:8],
+        "date_str": (sold_at or get_eastern_time()).strftime("%Y-%m-%d %H:%M:%S"),
+        "rows_html": "".join(_receipt_row_html(item) for item in cart_items),
+        "discount_html": "",
+        "final_total": final_total
+    }
+    
+    # Discount line
+    if discount_pct > 0:
+        fields["discount_html"] = _RECEIPT_DISCOUNT_TEMPLATE.format(
+            subtotal=subtotal, discount_pct=discount_pct, discount_amount=discount_amount
+        )
+    
+    auto_print_script = "<script>window.onload = function() { window.print(); }</script>" if auto_print else ""
+    body_head = _RECEIPT_BODY_HEAD.format_map(fields)
+    body_tail = _RECEIPT_BODY_TAIL.format_map(fields)
+    
+    return _RECEIPT_DOC_TEMPLATE.format(
+        auto_print_script=auto_print_script,
+        customer_body=body_head + "CUSTOMER COPY" + body_tail,
+        merchant_body=body_head + "MERCHANT COPY" + body_tail
+    )
+
+def last_receipt_html(auto_print=False):
+    """HTML for the last receipt, rendered once per receipt and print mode and reused across reruns."""
+    data = st.session_state["last_receipt_data"]
+    cached = st.session_state.get("_last_receipt_html")
+    if cached is None or cached[0] != data["receipt_id"]:
+        cached = (data["receipt_id"], {})
+        st.session_state["_last_receipt_html"] = cached
+    if auto_print not in cached[1]:
+        cached[1][auto_print] = generate_receipt_html(**data, auto_print=auto_print)
+    return cached[1][auto_print]
 
 # --- Authentication ---
 
 def check_global_password():
     """Checks for the 'Global Wall' password."""
-    correct_password = get_setting("global_password", "0000")
-    
     def password_entered():
         entered = st.session_state.get("global_password_input", "")
-        if entered == correct_password:
+        # Fetched only when a password is submitted, never on an authed rerun
+        if hmac.compare_digest(entered.encode(), str(_session_setting("global_password", "0000")).encode()):
             st.session_state["global_access_granted"] = True
             st.session_state["global_password_input"] = ""
         else:
@@ -208,19 +485,27 @@ def check_global_password():
         st.session_state["global_access_granted"] = False
 
     if not st.session_state["global_access_granted"]:
-        st.text_input("🔒 Enter App Password to Access", type="password", on_change=password_entered, key="global_password_input")
-        st.error("Please log in to access the system.")
+        def login_form():
+            st.text_input("🔒 Enter App Password to Access", type="password", on_change=password_entered, key="global_password_input")
+            if st.session_state["global_access_granted"]:
+                st.rerun() # Leave the fragment and render the full app
+            st.error("Please log in to access the system.")
+
+        # Only the login form reruns on input until access is granted
+        if hasattr(st, "fragment"):
+            st.fragment(login_form)()
+        else:
+            login_form()
         return False
     
     return True
 
 def check_admin_password():
     """Checks for the 'Admin' password for sensitive actions."""
-    correct_password = get_setting("admin_password", "0000")
-
     def password_entered():
         entered = st.session_state.get("admin_password_input", "")
-        if entered == correct_password:
+        # Fetched only when a password is submitted, never on an authed rerun
+        if hmac.compare_digest(entered.encode(), str(_session_setting("admin_password", "0000")).encode()):
             st.session_state["admin_access_granted"] = True
             st.session_state["admin_password_input"] = ""
         else:
@@ -255,128 +540,75 @@ menu = ["Dashboard", "Transactions", "History", "Inventory (Admin)", "Settings (
 page = st.sidebar.selectbox("Navigate", menu)
 
 if page == "📺 Customer View":
-    st.markdown("""
-        <style>
-            [data-testid="stSidebar"], [data-testid="stHeader"], footer {display: none;}
-            
-            /* Large Fonts */
-            .cust-item-name { font-size: 2.0rem !important; font-weight: bold; color: #333; }
-            .cust-item-detail { font-size: 2.0rem !important; color: #555; }
-            .cust-promo { font-size: 1.5rem !important; color: #d9534f; font-weight: bold; }
-            
-            /* Totals Box */
-            .total-box { 
-                background-color: #d1ecf1; 
-                padding: 30px; 
-                border-radius: 15px; 
-                text-align: right; 
-                margin-top: 30px;
-                border: 2px solid #bee5eb;
-            }
-            .total-label { font-size: 1.8rem !important; color: #0c5460; }
-            .total-amt { font-size: 3.2rem !important; font-weight: 800; color: #000; }
-        </style>
-    """, unsafe_allow_html=True)
+    st.markdown(CUSTOMER_VIEW_CSS, unsafe_allow_html=True)
     
     st.title("🛒 Customer Display (v2.1)")
     
-    # Poll for live cart data
-    cart_data = get_live_cart()
-    
-    # Adaptive Polling
-    if "last_cart_data" not in st.session_state:
-        st.session_state["last_cart_data"] = {}
+    def customer_display():
+        """Polls the live cart and renders it; returns the next poll interval in seconds."""
+        # Poll for live cart data
+        cart_data = get_live_cart()
     
-    import json
-    current_hash = json.dumps(cart_data, sort_keys=True) if cart_data else ""
-    last_hash = json.dumps(st.session_state["last_cart_data"], sort_keys=True) if st.session_state["last_cart_data"] else ""
-    
-    has_changed = current_hash != last_hash
-    if has_changed:
-        st.session_state["last_cart_data"] = cart_data
-        poll_interval = 1 # Active: Fast updates
-    else:
-        poll_interval = 2 # Idle: Fast check for resets
+        # Adaptive Polling
+        current_hash = cart_fingerprint(cart_data)
+        has_changed = current_hash != st.session_state.get("last_cart_fingerprint")
+        if has_changed:
+            st.session_state["last_cart_fingerprint"] = current_hash
+            poll_interval = 1 # Active: Fast updates
+        else:
+            poll_interval = 2 # Idle: Fast check for resets
         
-    # Main visual container for atomic updates
-    main_placeholder = st.empty()
+        # Main visual container for atomic updates
+        main_placeholder = st.empty()
     
-    with main_placeholder.container():
-        if not cart_data or not cart_data.get("items"):
-            st.markdown("<div style='text-align: center; margin-top: 100px;'>", unsafe_allow_html=True)
-            st.info("👋 Welcome! Items will appear here.", icon="🛒")
-            st.markdown("</div>", unsafe_allow_html=True)
-        else:
-            # Show Items
-            items = cart_data.get("items", [])
+        with main_placeholder.container():
+            if not cart_data or not cart_data.get("items"):
+                st.markdown("<div style='text-align: center; margin-top: 100px;'>", unsafe_allow_html=True)
+                st.info("👋 Welcome! Items will appear here.", icon="🛒")
+                st.markdown("</div>", unsafe_allow_html=True)
+            else:
+                # Show Items
+                items = cart_data.get("items", [])
             
-            # Explicit Containers for DOM separation
-            items_container = st.container()
-            totals_container = st.container()
+                # Explicit Containers for DOM separation
+                items_container = st.container()
+                totals_container = st.container()
             
-            with items_container:
-                # Table Data Construction
-                table_rows = []
-                for item in items:
-                    name = item['name']
-                    qty = item['qty']
-                    price = item['price']
-                    sale_pct = item.get('sale_percent', 0)
-                    bogo = item.get('bogo', False)
-                    eff_price = price * (1 - sale_pct/100)
-                    
-                    promos = []
-                    if sale_pct > 0:
-                        promos.append(f"🔥 -{sale_pct}%")
-                    if bogo:
-                        paid = get_bogo_paid_qty(qty, bogo) 
-                        free_qty = qty - paid
-                        promos.append(f"🎁 {free_qty} FREE")
-                    
-                    item_total = eff_price * get_bogo_paid_qty(qty, bogo)
-                    
-                    table_rows.append({
-                        "Item": name,
-                        "Price": f"${eff_price:.2f}" + (f" (Reg: ${price:.2f})" if sale_pct > 0 else ""),
-                        "Qty": qty,
-                        "Promos": " ".join(promos),
-                        "Total": f"${item_total:.2f}"
-                    })
+                with items_container:
+                    # Table Data Construction: rebuilt only when the cart changed.
+                    # Idle polls reuse the last table (it must still be emitted, or Streamlit clears it)
+                    rendered = st.session_state.get("cv_rendered")
+                    if rendered is None or rendered[0] != current_hash:
+                        rendered = (current_hash, customer_table_html(build_customer_table(items)) if items else None)
+                        st.session_state["cv_rendered"] = rendered
                 
-                # Display Table
-                if table_rows:
-                    df_display = pd.DataFrame(table_rows)
-                    # Use st.dataframe for clean table view
-                    # Dynamic key forces re-render on data change (Fixes ghost items)
-                    st.dataframe(
-                        style_dataframe(df_display),
-                        width='stretch',
-                        hide_index=True,
-                        column_config={
-                            "Item": st.column_config.TextColumn("Item", width="large"),
-                            "Price": st.column_config.TextColumn("Price"),
-                            "Qty": st.column_config.NumberColumn("Qty", format="%d"),
-                            "Promos": st.column_config.TextColumn("Promos", width="medium"),
-                            "Total": st.column_config.TextColumn("Total"),
-                        },
-                        key=f"cust_table_{len(table_rows)}_{cart_data.get('total', 0)}"
-                    )
-
-            with totals_container:
-                # Totals Logic
-                subtotal = cart_data.get("subtotal", 0)
-                discount = cart_data.get("discount", 0)
-                total = cart_data.get("total", 0)
+                    # Display Table
+                    if rendered[1]:
+                        st.markdown(rendered[1], unsafe_allow_html=True)
+
+                with totals_container:
+                    # Totals Logic
+                    subtotal = cart_data.get("subtotal", 0)
+                    discount = cart_data.get("discount", 0)
+                    total = cart_data.get("total", 0)
                 
-                col_t1, col_t2 = st.columns([1, 1])
-                with col_t2:
-                    st.markdown(f"<div class='total-box'>", unsafe_allow_html=True)
-                    st.markdown(f"<div class='total-label'>Subtotal: ${subtotal:.2f}</div>", unsafe_allow_html=True)
-                    if discount > 0:
-                         st.markdown(f"<div class='total-label' style='color: #d9534f;'>Discount: -${discount:.2f}</div>", unsafe_allow_html=True)
-                    st.markdown(f"<div class='total-amt'>${total:.2f}</div>", unsafe_allow_html=True)
-                    st.markdown("</div>", unsafe_allow_html=True)
+                    col_t1, col_t2 = st.columns([1, 1])
+                    with col_t2:
+                        st.markdown(f"<div class='total-box'>", unsafe_allow_html=True)
+                        st.markdown(f"<div class='total-label'>Subtotal: ${subtotal:.2f}</div>", unsafe_allow_html=True)
+                        if discount > 0:
+                             st.markdown(f"<div class='total-label' style='color: #d9534f;'>Discount: -${discount:.2f}</div>", unsafe_allow_html=True)
+                        st.markdown(f"<div class='total-amt'>${total:.2f}</div>", unsafe_allow_html=True)
+                        st.markdown("</div>", unsafe_allow_html=True)
+        return poll_interval
 
+    if hasattr(st, "fragment"):
+        # Only the display reruns each tick instead of the whole script
+        st.fragment(customer_display, run_every=1)()
+        st.stop()
+
+    # Fallback (no st.fragment): adaptive sleep + full rerun
+    poll_interval = customer_display()
     time.sleep(poll_interval)
     st.rerun()
     st.stop()
@@ -387,22 +619,22 @@ if page == "📺 Customer View":
 # --- Page Routing ---
 elif page == "Dashboard":
     st.header("Dashboard")
-    df = get_inventory_df()
+    stats = _cached_inventory_stats()
     
-    if not df.empty:
+    if stats["total_items"]:
         # Metrics
         col1, col2 = st.columns(2)
-        col1.metric("Total Items", len(df))
-        col2.metric("Total Stock", df['quantity'].sum())
+        col1.metric("Total Items", stats["total_items"])
+        col2.metric("Total Stock", stats["total_stock"])
         
-        # Low Stock Alert
-        low_stock = df[df['quantity'] <= df['min_threshold']]
+        # Low Stock Alert (filtered in Postgres)
+        low_stock = _cached_low_stock()
         if not low_stock.empty:
             st.warning(f"⚠️ {len(low_stock)} items are low on stock!")
             cols = ['name', 'quantity', 'min_threshold']
             if 'supplier' in low_stock.columns:
                 cols.append('supplier')
-            st.dataframe(style_dataframe(low_stock[cols]), hide_index=True)
+            st.dataframe(low_stock[cols], hide_index=True)
         else:
             st.success("All stock levels are healthy.")
             
@@ -418,10 +650,10 @@ elif page == "Inventory (Admin)":
     if not check_admin_password():
         st.stop()
         
-    # Show Value Here
-    df = get_inventory_df()
+    # Fetch once and reuse for the value metric, edit form and stock table
+    df = _cached_inventory()
     if not df.empty:
-        total_value = (df['quantity'] * df['price']).sum()
+        total_value = _cached_total_value()
         st.metric("Total Inventory Value", f"${total_value:,.2f}")
     
     # Add New Item Form
@@ -453,8 +685,8 @@ elif page == "Inventory (Admin)":
                 if name:
                     success, msg = add_item(name, category, maker, supplier, color, barcode, quantity, price, min_threshold, sale_percent, bogo)
                     if success:
-                        st.success(msg)
-                        time.sleep(1)
+                        invalidate_data_cache()
+                        st.toast(msg, icon="✅")
                         st.rerun()
                     else:
                         st.error(msg)
@@ -463,31 +695,28 @@ elif page == "Inventory (Admin)":
     
     # Update Item Settings
     with st.expander("⚙️ Update Item Settings"):
-        df = get_inventory_df()
         if not df.empty:
-            # Create list of names
-            item_list = df['name'].tolist()
+            # Blank out missing text fields once and index by name so the selected row is a hash lookup
+            by_name = df.fillna({'category': '', 'maker': '', 'supplier': '', 'color': '', 'barcode': ''}).set_index('name', drop=False)
+            item_list = by_name.index.tolist()
             edit_item_name = st.selectbox("Select Item to Edit", options=item_list)
             
             if edit_item_name:
-                item_row = df[df['name'] == edit_item_name].iloc[0]
+                item_row = by_name.loc[edit_item_name]
+                if isinstance(item_row, pd.DataFrame): # Duplicate names: take the first match
+                    item_row = item_row.iloc[0]
                 edit_id = int(item_row['id'])
                 
                 with st.form("edit_item_form"):
                     col1, col2 = st.columns(2)
                     new_name = col1.text_input("Item Name", value=item_row['name'])
-                    new_category = col2.text_input("Category", value=item_row['category'] if item_row['category'] else "")
+                    new_category = col2.text_input("Category", value=item_row['category'])
                     
                     col_maker, col_supplier, col_color, col_barcode = st.columns(4)
-                    curr_maker = item_row['maker'] if 'maker' in item_row and item_row['maker'] is not None else ""
-                    curr_supplier = item_row['supplier'] if 'supplier' in item_row and item_row['supplier'] is not None else ""
-                    curr_color = item_row['color'] if 'color' in item_row and item_row['color'] is not None else ""
-                    curr_barcode = item_row['barcode'] if 'barcode' in item_row and item_row['barcode'] is not None else ""
-                    
-                    new_maker = col_maker.text_input("Maker/Brand", value=curr_maker)
-                    new_supplier = col_supplier.text_input("Supplier", value=curr_supplier)
-                    new_color = col_color.text_input("Color", value=curr_color)
-                    new_barcode = col_barcode.text_input("Barcode", value=curr_barcode)
+                    new_maker = col_maker.text_input("Maker/Brand", value=item_row['maker'])
+                    new_supplier = col_supplier.text_input("Supplier", value=item_row['supplier'])
+                    new_color = col_color.text_input("Color", value=item_row['color'])
+                    new_barcode = col_barcode.text_input("Barcode", value=item_row['barcode'])
                     
                     col3, col4 = st.columns(2)
                     new_price = col3.number_input("Price", min_value=0.0, value=float(item_row['price']), step=0.01)
@@ -506,8 +735,8 @@ elif page == "Inventory (Admin)":
                         if st.form_submit_button("Update Item Details"):
                             success, msg = update_item_details(edit_id, new_name, new_category, new_maker, new_supplier, new_color, new_barcode, new_price, new_threshold, new_sale_percent, new_bogo)
                             if success:
-                                st.success(f"Updated {new_name}: {msg}")
-                                time.sleep(1)
+                                invalidate_data_cache()
+                                st.toast(f"Updated {new_name}: {msg}", icon="✅")
                                 st.rerun()
                             else:
                                 st.error(msg)
@@ -521,9 +750,9 @@ elif page == "Inventory (Admin)":
                             if confirm_delete:
                                 success, msg = delete_item(edit_id)
                                 if success:
-                                    st.success(msg)
+                                    invalidate_data_cache()
+                                    st.toast(msg, icon="✅")
                                     st.session_state["_reset_delete_check"] = True
-                                    time.sleep(1)
                                     st.rerun()
                                 else:
                                     st.error(msg)
@@ -535,20 +764,15 @@ elif page == "Inventory (Admin)":
     # View Inventory
     st.subheader("Current Stock")
     if not df.empty:
-        # Add promo badges to display
-        display_df = df.copy()
-        def promo_badge(row):
-            badges = []
-            if row.get('sale_percent', 0) and row['sale_percent'] > 0:
-                badges.append(f"🔥 {row['sale_percent']}% OFF")
-            if row.get('bogo', False):
-                badges.append("🎁 BOGO")
-            return " | ".join(badges) if badges else ""
-        
-        display_df['Promos'] = display_df.apply(promo_badge, axis=1)
+        # Add promo badges to display (column-wise, no per-row apply)
+        on_sale = df['sale_percent'].fillna(0) > 0
+        on_bogo = df['bogo'].fillna(False).astype(bool)
+        sale_tag = ("🔥 " + df['sale_percent'].astype(str) + "% OFF").where(on_sale, "")
+        bogo_tag = pd.Series("🎁 BOGO", index=df.index).where(on_bogo, "")
+        display_df = df.assign(Promos=(sale_tag + " | " + bogo_tag).where(on_sale & on_bogo, sale_tag + bogo_tag))
         show_cols = ['name', 'category', 'quantity', 'price', 'Promos', 'barcode']
         show_cols = [c for c in show_cols if c in display_df.columns]
-        st.dataframe(style_dataframe(display_df[show_cols]), use_container_width=True, hide_index=True)
+        st.dataframe(display_df[show_cols], use_container_width=True, hide_index=True)
     else:
         st.info("Inventory is empty.")
 
@@ -562,52 +786,34 @@ elif page == "Transactions":
     with col_mode_2:
         mode = st.radio("Mode", ["Sale", "Restock"], horizontal=True, label_visibility="collapsed")
         
-    df = get_inventory_df()
+    df, label_to_id, barcode_to_pos = _pos_inventory()
     if df.empty:
         st.warning("No items in inventory.")
     else:
-        # Create a display label for each item with promo badges
-        def format_item_label(row):
-            parts = [row['name']]
-            if 'color' in row and row['color']: parts.append(f"({row['color']})")
-            if 'barcode' in row and row['barcode']: parts.append(str(row['barcode']))
-            # Promo badges
-            sale_pct = row.get('sale_percent', 0)
-            if sale_pct and sale_pct > 0:
-                eff_price = get_effective_price(float(row['price']), sale_pct)
-                parts.append(f"🔥{sale_pct}%OFF ${row['price']:.2f}→${eff_price:.2f}")
-            if row.get('bogo', False):
-                parts.append("🎁BOGO")
-            parts.append(f"Stock: {row['quantity']}")
-            return " | ".join(parts)
-
-        item_map = {}
-        for index, row in df.iterrows():
-            label = format_item_label(row)
-            item_map[label] = row
-
         # --- Helper: Consolidated Cart Add ---
         def add_to_cart_consolidated(new_item):
             """Adds item to cart, incrementing quantity if it already exists."""
-            # Check if item with same ID and Note already exists
-            found = False
-            for existing in st.session_state["cart"]:
-                if existing['id'] == new_item['id'] and existing['note'] == new_item['note']:
-                    existing['qty'] += new_item['qty']
-                    found = True
-                    break
+            cart = st.session_state["cart"]
+            # (id, note) -> line_id; entries for removed/cleared lines simply miss the cart and are replaced
+            cart_index = st.session_state.setdefault("cart_index", {})
+            key = (new_item['id'], new_item['note'])
+            line_id = cart_index.get(key)
             
-            if not found:
-                st.session_state["cart"].append(new_item)
+            if line_id in cart:
+                cart[line_id]['qty'] += new_item['qty']
+            else:
+                line_id = uuid.uuid4().hex
+                cart[line_id] = new_item
+                cart_index[key] = line_id
             
         # --- Quick Scan Section ---
         def process_scan():
             code = st.session_state.get("barcode_input", "").strip()
             if code:
-                matches = df[df['barcode'].astype(str) == code]
+                pos = barcode_to_pos.get(code)
                 
-                if not matches.empty:
-                    row = matches.iloc[0]
+                if pos is not None:
+                    row = df.iloc[pos]
                     qty_to_add = 1
                     
                     if mode == "Sale" and row['quantity'] < qty_to_add:
@@ -624,7 +830,7 @@ elif page == "Transactions":
                             "bogo": bool(row.get('bogo', False))
                         }
                         add_to_cart_consolidated(item_data)
-                        sync_cart() # Sync to Customer Display
+                        sync_cart(debounce=True) # Sync to Customer Display
                         st.session_state["scan_msg"] = (True, f"Added: {row['name']}")
                 else:
                     st.session_state["scan_msg"] = (False, f"Barcode not found: {code}")
@@ -651,7 +857,6 @@ elif page == "Transactions":
             if st.button("🔄 Force Reset Customer Display", type="secondary"):
                  sync_cart()
                  st.toast("🔄 Customer Display Reset!")
-                 time.sleep(0.2)
                  st.rerun()
             
             # Auto-Sync Heartbeat (5s)
@@ -674,7 +879,7 @@ elif page == "Transactions":
         col_search, col_qty = st.columns([3, 1])
         
         with col_search:
-            selected_label = st.selectbox("Search Item (Manual)", options=list(item_map.keys()), placeholder="Type name or select...", key="pos_search", index=None)
+            selected_label = st.selectbox("Search Item (Manual)", options=label_to_id.keys(), placeholder="Type name or select...", key="pos_search", index=None)
             
         with col_qty:
             qty = st.number_input("Qty", min_value=1, key="pos_qty")
@@ -685,22 +890,23 @@ elif page == "Transactions":
             
         with col_add:
             # Callback for manual Add
-            def add_manual_item(item_map, mode):
+            def add_manual_item(label_to_id, mode):
                  key = st.session_state.get("pos_search")
                  qty = st.session_state.get("pos_qty", 1)
                  note = st.session_state.get("pos_note", "")
                  
                  if not key:
-                     st.session_state["manual_msg"] = (False, "Please select an item first.")
+                     st.toast("Please select an item first.", icon="⚠️")
                      return
 
-                 row = item_map.get(key)
-                 if row is None:
+                 item_id = label_to_id.get(key)
+                 if item_id is None:
                      return
+                 row = df.set_index('id', drop=False).loc[item_id]
                      
                  # Check Stock Logic
                  if mode == "Sale" and row['quantity'] < qty:
-                      st.session_state["manual_msg"] = (False, f"Not enough stock! (Available: {row['quantity']})")
+                      st.toast(f"Not enough stock! (Available: {row['quantity']})", icon="⚠️")
                       return
                  
                  # Success - include promo info
@@ -715,25 +921,16 @@ elif page == "Transactions":
                      "bogo": bool(row.get('bogo', False))
                  }
                  add_to_cart_consolidated(item_data)
-                 sync_cart() # Sync to Customer Display
-                 st.session_state["manual_msg"] = (True, f"Added {row['name']}")
+                 sync_cart(debounce=True) # Sync to Customer Display
+                 st.toast(f"Added {row['name']}", icon="✅")
                  
                  # Clear Inputs
                  st.session_state["pos_search"] = None
                  st.session_state["pos_qty"] = 1
                  st.session_state["pos_note"] = ""
 
-            st.button("Add to Cart", type="primary", on_click=add_manual_item, args=(item_map, mode))
-            
-            # Display Message
-            if "manual_msg" in st.session_state and st.session_state["manual_msg"]:
-                 m_success, m_msg = st.session_state["manual_msg"]
-                 if m_success:
-                     st.success(m_msg)
-                     st.session_state["manual_msg"] = None
-                 else:
-                     st.error(m_msg)
-                     st.session_state["manual_msg"] = None
+            # Feedback is toasted from the callback, so nothing is left to clear on a later rerun
+            st.button("Add to Cart", type="primary", on_click=add_manual_item, args=(label_to_id, mode))
 
     st.divider()
 
@@ -741,37 +938,11 @@ elif page == "Transactions":
     st.subheader("Shopping Cart")
     
     if st.session_state["cart"]:
-        cart_df = pd.DataFrame(st.session_state["cart"])
+        cart_items = list(st.session_state["cart"].values())
         
-        # Calculate display columns with promos
-        display_rows = []
-        for item in st.session_state["cart"]:
-            price = item['price']
-            sale_pct = item.get('sale_percent', 0)
-            eff_price = get_effective_price(price, sale_pct)
-            bogo = item.get('bogo', False)
-            qty = item['qty']
-            paid_qty = get_bogo_paid_qty(qty, bogo)
-            item_total = eff_price * paid_qty
-            
-            # Build promo text
-            promo = ""
-            if sale_pct and sale_pct > 0:
-                promo += f"🔥-{sale_pct}% "
-            if bogo and qty >= 2:
-                promo += f"🎁{qty - paid_qty} FREE "
-            
-            display_rows.append({
-                "Name": item['name'],
-                "Qty": qty,
-                "Price": f"${eff_price:.2f}" + (f" (was ${price:.2f})" if sale_pct > 0 else ""),
-                "Promos": promo.strip(),
-                "Total": f"${item_total:.2f}",
-                "Note": item.get('note', '')
-            })
-        
-        display_cart_df = pd.DataFrame(display_rows)
-        st.dataframe(style_dataframe(display_cart_df), width='stretch', hide_index=True)
+        # Reserve the table's spot; it is filled after the checkout buttons, so a
+        # checkout that empties the cart and reruns never builds it
+        cart_table_slot = st.empty()
         
         # Checkout Discount (use reset flag to avoid StreamlitAPIException)
         if st.session_state.get("_reset_discount", False):
@@ -782,10 +953,10 @@ elif page == "Transactions":
         
         col_discount, col_total = st.columns([1, 2])
         with col_discount:
-            checkout_discount_pct = st.number_input("🏷️ Checkout Discount %", min_value=0, max_value=50, key="checkout_discount", help="Apply an additional discount to the entire purchase", on_change=sync_cart)
+            checkout_discount_pct = st.number_input("🏷️ Checkout Discount %", min_value=0, max_value=50, key="checkout_discount", help="Apply an additional discount to the entire purchase", on_change=sync_cart, kwargs={"debounce": True})
         
         # Calculate totals
-        subtotal, discount_amount, final_total = calculate_cart_totals(st.session_state["cart"], checkout_discount_pct)
+        subtotal, discount_amount, final_total = calculate_cart_totals(cart_items, checkout_discount_pct)
         
         with col_total:
             if checkout_discount_pct > 0:
@@ -794,12 +965,12 @@ elif page == "Transactions":
             st.markdown(f"### 💰 Total: ${final_total:,.2f}")
         
         # Remove Item Logic
-        item_to_remove = st.selectbox("Remove Item:", options=cart_df['name'].tolist(), index=None, placeholder="Select item to remove...")
+        cart = st.session_state["cart"]
+        item_to_remove = st.selectbox("Remove Item:", options=list(cart), format_func=lambda line_id: f"{cart[line_id]['name']} × {cart[line_id]['qty']}", index=None, placeholder="Select item to remove...")
         if st.button("Remove Selected Item"):
-            if item_to_remove:
-                st.session_state["cart"] = [i for i in st.session_state["cart"] if i['name'] != item_to_remove]
+            if item_to_remove in cart:
+                del cart[item_to_remove]
                 sync_cart() # Sync to Customer Display
-                time.sleep(0.2) # Ensure sync completes
                 st.rerun()
         
         st.divider()
@@ -826,108 +997,123 @@ elif page == "Transactions":
                 
                 with col_cash:
                     if st.button("💵 PAY CASH", type="primary", use_container_width=True):
-                        success, receipt_id = process_batch_transaction(st.session_state["cart"], "SALE", "CASH")
+                        success, receipt_id = process_batch_transaction(cart_items, "SALE", "CASH")
                         
                         if success:
-                            st.success("Cash Transaction Complete!")
+                            invalidate_data_cache()
+                            st.toast("Cash Transaction Complete!", icon="✅")
                             
                             if generate_receipt:
-                                receipt_html = generate_receipt_html(st.session_state["cart"], subtotal, checkout_discount_pct, discount_amount, final_total, receipt_id, auto_print=False)
-                                st.session_state["last_receipt"] = receipt_html
-                                
-                                if auto_print:
-                                    receipt_html_print = receipt_html.replace("</head>", "<script>window.onload = function() { window.print(); }</head>")
-                                    st.session_state["actions_trigger_print"] = receipt_html_print
-                                else:
-                                     st.session_state["actions_trigger_print"] = None
+                                # Keep only the receipt data; HTML is rendered when printed or viewed
+                                receipt_data = {"cart_items": cart_items, "subtotal": subtotal, "discount_pct": checkout_discount_pct, "discount_amount": discount_amount, "final_total": final_total, "receipt_id": receipt_id, "sold_at": get_eastern_time()}
+                                st.session_state["last_receipt_data"] = receipt_data
+                                st.session_state["actions_trigger_print"] = last_receipt_html(auto_print=True) if auto_print else None
                             else:
-                                st.session_state["last_receipt"] = None
+                                st.session_state["last_receipt_data"] = None
                                 st.session_state["actions_trigger_print"] = None
 
-                            st.session_state["cart"] = []
+                            st.session_state["cart"] = {}
                             st.session_state["_reset_discount"] = True
                             sync_cart() # Sync empty cart to Customer Display
-                            time.sleep(0.2) # WAIT for DB sync!
                             st.rerun()
                         else:
                             st.error(f"Transaction Failed: {receipt_id}")
 
                 with col_card:
                     if st.button("💳 PAY CARD", type="secondary", use_container_width=True):
-                        success, receipt_id = process_batch_transaction(st.session_state["cart"], "SALE", "CARD")
+                        success, receipt_id = process_batch_transaction(cart_items, "SALE", "CARD")
                         
                         if success:
-                            st.success("Card Transaction Recorded!")
+                            invalidate_data_cache()
+                            st.toast("Card Transaction Recorded!", icon="✅")
                             
                             if generate_receipt:
-                                receipt_html = generate_receipt_html(st.session_state["cart"], subtotal, checkout_discount_pct, discount_amount, final_total, receipt_id, auto_print=False)
-                                st.session_state["last_receipt"] = receipt_html
-                                
-                                if auto_print:
-                                    receipt_html_print = receipt_html.replace("</head>", "<script>window.onload = function() { window.print(); }</head>")
-                                    st.session_state["actions_trigger_print"] = receipt_html_print
-                                else:
-                                     st.session_state["actions_trigger_print"] = None
+                                # Keep only the receipt data; HTML is rendered when printed or viewed
+                                receipt_data = {"cart_items": cart_items, "subtotal": subtotal, "discount_pct": checkout_discount_pct, "discount_amount": discount_amount, "final_total": final_total, "receipt_id": receipt_id, "sold_at": get_eastern_time()}
+                                st.session_state["last_receipt_data"] = receipt_data
+                                st.session_state["actions_trigger_print"] = last_receipt_html(auto_print=True) if auto_print else None
                             else:
-                                st.session_state["last_receipt"] = None
+                                st.session_state["last_receipt_data"] = None
                                 st.session_state["actions_trigger_print"] = None
                             
-                            st.session_state["cart"] = []
+                            st.session_state["cart"] = {}
                             st.session_state["_reset_discount"] = True
                             sync_cart() # Sync empty cart to Customer Display
-                            time.sleep(0.2) # WAIT for DB sync!
                             st.rerun()
                         else:
                             st.error(f"Transaction Failed: {receipt_id}")
             
             else: # Restock Mode
                 if st.button("📦 CONFIRM RESTOCK", type="primary", use_container_width=True):
-                    success, receipt_id = process_batch_transaction(st.session_state["cart"], "RESTOCK", "MANUAL")
+                    success, receipt_id = process_batch_transaction(cart_items, "RESTOCK", "MANUAL")
                     
                     if success:
-                        st.success("Restock Complete! Inventory Updated.")
-                        st.session_state["cart"] = []
+                        invalidate_data_cache()
+                        st.toast("Restock Complete! Inventory Updated.", icon="✅")
+                        st.session_state["cart"] = {}
                         st.session_state["_reset_discount"] = True
                         sync_cart() # Clear Customer Display
-                        time.sleep(0.2) # WAIT for DB sync!
                         st.rerun()
                     else:
                         st.error(f"Restock Failed: {receipt_id}")
                     
         if st.button("Empty Cart (Cancel)"):
-             st.session_state["cart"] = []
+             st.session_state["cart"] = {}
              st.session_state["_reset_discount"] = True
              sync_cart() # Clear Customer Display
-             time.sleep(0.2) # WAIT for DB sync!
              st.rerun()
+        
+        # Calculate display columns with promos
+        cart_table_slot.dataframe(
+            build_cart_table(cart_items),
+            width='stretch',
+            hide_index=True,
+            column_config={"Total": st.column_config.NumberColumn("Total", format="$%.2f")}
+        )
              
     # Handle Auto-Print Trigger (Immediate)
     if "actions_trigger_print" in st.session_state and st.session_state["actions_trigger_print"]:
          st.components.v1.html(st.session_state["actions_trigger_print"], height=0, width=0, scrolling=False)
          st.session_state["actions_trigger_print"] = None
 
-    # Show Last Receipt (Passive View)
-    if "last_receipt" in st.session_state and st.session_state["last_receipt"]:
+    # Show Last Receipt (Passive View, rendered only on request)
+    if "last_receipt_data" in st.session_state and st.session_state["last_receipt_data"]:
+        receipt_data = st.session_state["last_receipt_data"]
         st.divider()
         st.subheader("📄 Last Transaction Receipt")
         col_repr_1, col_repr_2 = st.columns([1, 4])
         
         with col_repr_1:
             if st.button("🖨️ Reprint Receipt"):
-                print_html = st.session_state["last_receipt"].replace("</head>", "<script>window.onload = function() { window.print(); }</script></head>")
-                st.components.v1.html(print_html, height=0, width=0, scrolling=False)
+                st.components.v1.html(last_receipt_html(auto_print=True), height=0, width=0, scrolling=False)
 
-        with st.expander("View Receipt", expanded=True):
-             st.components.v1.html(st.session_state["last_receipt"], height=600, scrolling=True)
+        with col_repr_2:
+            show_receipt = st.checkbox("👁️ View Receipt", key="show_last_receipt")
+        
+        if show_receipt:
+             st.components.v1.html(last_receipt_html(), height=600, scrolling=True)
             
     else:
         st.info("Cart is empty.")
 
 elif page == "History":
     st.header("Transaction History")
-    df = get_transactions_df(limit=200)
+    col_page, col_size = st.columns([1, 1])
+    page_size = col_size.selectbox("Rows per page", [20, 50, 100], index=1)
+    log_version = get_log_flush_count()
+    total = _cached_transaction_count(log_version)
+    # Bound the pager by the real page count when the count is available
+    page_count = max(1, -(-total // page_size)) if total is not None else None
+    if page_count is not None and st.session_state.get("history_page", 1) > page_count:
+        st.session_state["history_page"] = page_count # e.g. after switching to a larger page size
+    page_num = col_page.number_input("Page", min_value=1, max_value=page_count, step=1, key="history_page")
+    if total is not None:
+        col_page.caption(f"{total} transactions, {page_count} page(s)")
+    df = _cached_transactions(limit=page_size, offset=(page_num - 1) * page_size, log_version=log_version)
     if not df.empty:
-        st.dataframe(style_dataframe(df), width='stretch', hide_index=True)
+        st.dataframe(df, width='stretch', hide_index=True)
+    elif page_num > 1:
+        st.info("No more transactions on this page.")
     else:
         st.info("No transactions recorded yet.")
 
@@ -944,8 +1130,13 @@ elif page == "Settings (Admin)":
             new_global = st.text_input("New App Access Password", type="password")
             if st.button("Update App Password"):
                 if new_global:
-                    set_setting("global_password", new_global)
-                    st.success("App Password updated!")
+                    success, msg = set_setting("global_password", new_global)
+                    if success:
+                        _cached_setting.clear()
+                        st.session_state.pop("_setting_global_password", None)
+                        st.success("App Password updated!")
+                    else:
+                        st.error(msg)
                 else:
                     st.error("Password cannot be empty")
         
@@ -953,8 +1144,13 @@ elif page == "Settings (Admin)":
             new_admin = st.text_input("New Admin Password", type="password")
             if st.button("Update Admin Password"):
                 if new_admin:
-                    set_setting("admin_password", new_admin)
-                    st.success("Admin Password updated!")
+                    success, msg = set_setting("admin_password", new_admin)
+                    if success:
+                        _cached_setting.clear()
+                        st.session_state.pop("_setting_admin_password", None)
+                        st.success("Admin Password updated!")
+                    else:
+                        st.error(msg)
                 else:
                     st.error("Password cannot be empty")
 
@@ -966,25 +1162,28 @@ elif page == "Settings (Admin)":
     st.divider()
     st.subheader("Export Data")
     
-    col1, col2 = st.columns(2)
-    with col1:
-        if st.button("Download Inventory as CSV"):
-            df = get_inventory_df()
-            csv = df.to_csv(index=False).encode('utf-8')
-            st.download_button(
-                label="Click to Download Inventory CSV",
-                data=csv,
-                file_name='inventory_export.csv',
-                mime='text/csv',
-            )
-    
-    with col2:
-            if st.button("Download Transactions as CSV"):
-                df = get_transactions_df(limit=10000)
-                csv = df.to_csv(index=False).encode('utf-8')
+    # Fetching and serializing both tables is the expensive part, so only do it on request
+    if not st.session_state.get("export_ready"):
+        st.button("Prepare Export", on_click=lambda: st.session_state.update(export_ready=True))
+    else:
+        try:
+            inventory_csv, transactions_csv = _export_csvs()
+        except Exception as e:
+            st.error(f"Export failed: {e}")
+        else:
+            col1, col2 = st.columns(2)
+            with col1:
+                st.download_button(
+                    label="Download Inventory as CSV",
+                    data=inventory_csv,
+                    file_name='inventory_export.csv',
+                    mime='text/csv',
+                )
+        
+            with col2:
                 st.download_button(
-                    label="Click to Download Transactions CSV",
-                    data=csv,
+                    label="Download Transactions as CSV",
+                    data=transactions_csv,
                     file_name='transactions_export.csv',
                     mime='text/csv',
                 )
\ No newline at end of file
@@ -1,4 +1,8 @@
 import os
+import atexit
+import json
+import queue
+import threading
 import streamlit as st
 import pandas as pd
 from datetime import datetime, timedelta
@@ -19,10 +23,45 @@ except Exception:
     st.error("Missing secrets! Make sure you have .streamlit/secrets.toml locally or secrets configured in Cloud.")
     st.stop()
 
-@st.cache_resource(ttl=3600)
+def _client_options():
+    """Options that share one keep-alive (HTTP/2 when h2 is installed) httpx pool across all calls.
+
+    Returns None if even plain ClientOptions can't be built, in which case the library defaults are used.
+    """
+    try:
+        from supabase.lib.client_options import ClientOptions
+    except ImportError as e:
+        print(f"⚠️ ClientOptions unavailable, using the default client: {e}")
+        return None
+    try:
+        import httpx
+        try:
+            import h2  # noqa: F401 - httpx needs it for http2=True
+            http2 = True
+        except ImportError:
+            http2 = False
+        http_client = httpx.Client(
+            http2=http2,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=300.0),
+            timeout=30,
+        )
+        return ClientOptions(httpx_client=http_client, postgrest_client_timeout=30)
+    except Exception as e:
+        # supabase-py < 2.16 has no httpx_client option: keep its per-client session
+        print(f"⚠️ Shared httpx pool unavailable, using default client options: {e}")
+        return ClientOptions(postgrest_client_timeout=30)
+
+# supabase-py speaks HTTP to PostgREST, which keeps its own pooled Postgres connections
+# server-side, so the transaction-mode pooler (port 6543, pgbouncer=true) only matters for
+# direct Postgres drivers. cache_resource gives one client per process, so connections to
+# the API are bounded by the httpx limits above no matter how many sessions rerun.
+@st.cache_resource
 def init_connection():
     try:
-        return create_client(SUPABASE_URL, SUPABASE_KEY)
+        options = _client_options()
+        if options is None:
+            return create_client(SUPABASE_URL, SUPABASE_KEY)
+        return create_client(SUPABASE_URL, SUPABASE_KEY, options=options)
     except Exception as e:
         st.error(f"Failed to connect to Supabase: {e}")
         return None
@@ -31,8 +70,17 @@ supabase = init_connection()
 
 # --- Retry Logic for Stability ---
 import time
+import random
 from functools import wraps
 
+# Error codes that fail the same way on every attempt: data exceptions (22xxx),
+# integrity violations (23xxx), undefined objects/syntax (42xxx), PostgREST request errors
+NON_RETRYABLE_CODE_PREFIXES = ("22", "23", "42", "PGRST")
+
+def is_retryable(e):
+    """Connection errors, timeouts and 5xx may be transient; rejected statements are not."""
+    return not str(getattr(e, "code", None) or "").startswith(NON_RETRYABLE_CODE_PREFIXES)
+
 def retry_db(max_retries=3, delay=1):
     def decorator(func):
         @wraps(func)
@@ -41,10 +89,13 @@ def retry_db(max_retries=3, delay=1):
                 try:
                     return func(*args, **kwargs)
                 except Exception as e:
+                    if not is_retryable(e):
+                        raise e
                     if i == max_retries - 1:
                         print(f"DB Error after {max_retries} retries: {e}")
                         raise e
-                    time.sleep(delay * (i + 1)) # Exponential-ish backoff
+                    # Linear backoff plus jitter so clients don't retry in lockstep
+                    time.sleep(delay * (i + 1) + random.uniform(0, 0.3))
         return wrapper
     return decorator
 
@@ -52,28 +103,29 @@ def retry_db(max_retries=3, delay=1):
 def init_settings():
     """Ensure default settings exist."""
     try:
-        # Check if settings exist, if not insert defaults
+        # Insert defaults in one call; keys that already exist are left untouched
         defaults = [
             {"key": "global_password", "value": "0000"},
             {"key": "admin_password", "value": "0000"}
         ]
         
-        for d in defaults:
-            existing = supabase.table("system_settings").select("key").eq("key", d["key"]).execute()
-            if not existing.data:
-                supabase.table("system_settings").insert(d).execute()
+        supabase.table("system_settings").upsert(defaults, on_conflict="key", ignore_duplicates=True).execute()
                 
     except Exception as e:
         print(f"Settings init failed (maybe table doesn't exist yet): {e}")
 
-def get_setting(key, default=None):
-    """Fetch a setting value by key."""
+def get_setting(key, default=None, raise_errors=False):
+    """Fetch a setting value by key.
+    A missing key returns default; with raise_errors=True any other failure raises instead,
+    so callers that cache the result don't cache a fallback."""
     try:
         response = supabase.table("system_settings").select("value").eq("key", key).single().execute()
         if response.data:
             return response.data['value']
         return default
     except Exception as e:
+        if raise_errors and getattr(e, "code", None) != "PGRST116": # PGRST116: no row for this key
+            raise
         return default
 
 def set_setting(key, value):
@@ -85,42 +137,156 @@ def set_setting(key, value):
     except Exception as e:
         return False, str(e)
 
+@st.cache_resource
+def ensure_settings_initialized():
+    """Seed the default settings once per server process, off the import path so first paint doesn't wait.
+
+    Until the seed lands, get_setting falls back to its caller's default, which matches the seeded value.
+    """
+    threading.Thread(target=init_settings, daemon=True, name="settings-init").start()
+    return True
+
 if supabase:
-    init_settings()
+    ensure_settings_initialized()
 
 # --- Core Functions ---
 
+INVENTORY_COLUMNS = ['id', 'name', 'category', 'maker', 'supplier', 'color', 'barcode', 'quantity', 'price', 'min_threshold', 'sale_percent', 'bogo']
+INVENTORY_TEXT_COLUMNS = ['name', 'category', 'maker', 'supplier', 'color', 'barcode']
+TRANSACTION_TEXT_COLUMNS = ['item_name', 'type', 'note', 'receipt_id', 'payment_method']
+# Added after the original schema; older databases may not have them yet
+PROMO_COLUMNS = ('sale_percent', 'bogo')
+
+# Undefined column in Postgres / column missing from PostgREST's schema cache
+MISSING_COLUMN_CODES = ("42703", "PGRST204")
+
+def _to_arrow_dtypes(df, text_columns):
+    """Arrow-backed dtypes let st.dataframe skip the numpy -> Arrow conversion.
+    Text columns are typed explicitly: left to inference, an all-NULL one becomes null[pyarrow], which can't be fillna'd."""
+    text = [col for col in text_columns if col in df.columns]
+    if text:
+        df[text] = df[text].astype('string[pyarrow]')
+    return df.convert_dtypes(dtype_backend='pyarrow')
+
 @retry_db(max_retries=3)
-def get_inventory_df():
-    """Fetch all inventory items as a DataFrame."""
+def get_inventory_df(columns=None, raise_errors=False):
+    """Fetch inventory items as a DataFrame, optionally only the given columns.
+    With raise_errors=True a failure raises instead of showing st.error and returning an empty frame."""
     try:
-        response = supabase.table("inventory").select("*").order("id").execute()
+        wanted = list(columns) if columns else INVENTORY_COLUMNS
+        try:
+            response = supabase.table("inventory").select(",".join(columns) if columns else "*").order("id").execute()
+        except Exception as e:
+            # A projection naming the promo columns fails on a DB without them: fetch the rest, default them below
+            if not columns or getattr(e, "code", None) not in MISSING_COLUMN_CODES:
+                raise
+            base = [col for col in columns if col not in PROMO_COLUMNS]
+            response = supabase.table("inventory").select(",".join(base)).order("id").execute()
         data = response.data
         if not data:
-            return pd.DataFrame(columns=['id', 'name', 'category', 'maker', 'supplier', 'color', 'barcode', 'quantity', 'price', 'min_threshold', 'sale_percent', 'bogo'])
+            return pd.DataFrame(columns=wanted)
         df = pd.DataFrame(data)
-        # Ensure promo columns exist even if DB hasn't been updated yet
-        if 'sale_percent' not in df.columns:
-            df['sale_percent'] = 0
-        if 'bogo' not in df.columns:
-            df['bogo'] = False
-        df['sale_percent'] = df['sale_percent'].fillna(0).astype(int)
-        df['bogo'] = df['bogo'].fillna(False).astype(bool)
-        return df
+        # Ensure promo columns exist even if DB hasn't been updated yet (filled before the Arrow conversion)
+        if 'sale_percent' in wanted:
+            if 'sale_percent' not in df.columns:
+                df['sale_percent'] = 0
+            df['sale_percent'] = df['sale_percent'].fillna(0).astype(int)
+        if 'bogo' in wanted:
+            if 'bogo' not in df.columns:
+                df['bogo'] = False
+            df['bogo'] = df['bogo'].fillna(False).astype(bool)
+        return _to_arrow_dtypes(df, INVENTORY_TEXT_COLUMNS)
     except Exception as e:
+        if raise_errors:
+            raise
         st.error(f"Error fetching inventory: {e}")
         return pd.DataFrame()
 
+# Flipped off once inventory_version() fails for a non-transient reason, so we stop asking
+_inventory_version_available = True
+
+def get_inventory_version():
+    """Fetch the inventory change counter (bumped by a trigger on every write), or None if unavailable."""
+    global _inventory_version_available
+    if not _inventory_version_available:
+        return None
+    try:
+        response = supabase.rpc("inventory_version", {}).execute()
+        return int(response.data) if response.data is not None else None
+    except Exception as e:
+        # Missing function (PGRST202), bad call or bad response won't fix themselves; timeouts might
+        if not is_retryable(e) or isinstance(e, (TypeError, ValueError)):
+            _inventory_version_available = False
+        print(f"⚠️ inventory_version RPC failed, falling back to TTL caching: {e}")
+        return None
+
+def _log_rpc_fallback(func_name, e, fallback):
+    """Report why an RPC fell back to client-side work: function not created yet vs. the call itself failing."""
+    if getattr(e, "code", None) == "PGRST202":
+        print(f"⚠️ {func_name}() not created yet (see supabase_functions.sql), {fallback}")
+    else:
+        print(f"⚠️ {func_name} RPC failed ({type(e).__name__}), {fallback}: {e}")
+
+@retry_db(max_retries=3)
+def get_inventory_stats():
+    """Fetch item count and total stock, aggregated in Postgres."""
+    try:
+        response = supabase.rpc("inventory_stats", {}).execute()
+        row = response.data[0] if response.data else {}
+        return {"total_items": int(row.get("total_items") or 0), "total_stock": int(row.get("total_stock") or 0)}
+    except Exception as e:
+        _log_rpc_fallback("inventory_stats", e, "aggregating client-side")
+        df = get_inventory_df()
+        if df.empty:
+            return {"total_items": 0, "total_stock": 0}
+        return {"total_items": len(df), "total_stock": int(df['quantity'].sum())}
+
+@retry_db(max_retries=3)
+def get_inventory_total_value():
+    """Fetch the total stock value (sum of quantity * price), computed in Postgres."""
+    try:
+        response = supabase.rpc("inventory_total_value", {}).execute()
+        return float(response.data or 0)
+    except Exception as e:
+        _log_rpc_fallback("inventory_total_value", e, "summing client-side")
+        df = get_inventory_df(['quantity', 'price'])
+        if df.empty:
+            return 0.0
+        return float((df['quantity'] * df['price']).sum())
+
+@retry_db(max_retries=3)
+def get_low_stock_df():
+    """Fetch only the items at or below their low stock threshold."""
+    try:
+        response = supabase.rpc("low_stock_items", {}).execute()
+        return pd.DataFrame(response.data or [])
+    except Exception as e:
+        _log_rpc_fallback("low_stock_items", e, "filtering client-side")
+        df = get_inventory_df()
+        if df.empty:
+            return df
+        return df[df['quantity'] <= df['min_threshold']]
+
+def get_transaction_count():
+    """Total number of transactions (a HEAD request with an exact count), or None if unavailable."""
+    try:
+        response = supabase.table("transactions").select("id", head=True, count="exact").execute()
+        return response.count
+    except Exception as e:
+        print(f"⚠️ Transaction count failed: {e}")
+        return None
+
 @retry_db(max_retries=3)
-def get_transactions_df(limit=100):
-    """Fetch recent transactions and convert timestamps to Eastern Time."""
+def get_transactions_df(limit=100, offset=0, raise_errors=False):
+    """Fetch a page of recent transactions and convert timestamps to Eastern Time.
+    With raise_errors=True a failure raises instead of showing st.error and returning an empty frame."""
     try:
-        response = supabase.table("transactions").select("*").order("timestamp", desc=True).limit(limit).execute()
+        response = supabase.table("transactions").select("*").order("timestamp", desc=True).range(offset, offset + limit - 1).execute()
         data = response.data
         if not data:
             return pd.DataFrame(columns=['id', 'item_id', 'item_name', 'type', 'quantity', 'timestamp', 'note', 'receipt_id', 'payment_method'])
         
-        df = pd.DataFrame(data)
+        df = _to_arrow_dtypes(pd.DataFrame(data), TRANSACTION_TEXT_COLUMNS)
         
         # Convert UTC timestamp strings to Eastern Time for display
         if 'timestamp' in df.columns:
@@ -132,9 +298,31 @@ def get_transactions_df(limit=100):
                 
         return df
     except Exception as e:
+        if raise_errors:
+            raise
         st.error(f"Error fetching transactions: {e}")
         return pd.DataFrame()
 
+def _pgrst_quote(value):
+    """Double-quote a value for a PostgREST or_() filter so commas, dots and parentheses stay literal."""
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+# None until inventory_unique_keys() answers; then whether the name/barcode unique indexes exist
+_inventory_unique_keys = None
+
+def inventory_unique_keys_enforced():
+    """Whether Postgres enforces unique item names and barcodes (asked once per process)."""
+    global _inventory_unique_keys
+    if _inventory_unique_keys is None:
+        try:
+            _inventory_unique_keys = bool(supabase.rpc("inventory_unique_keys", {}).execute().data)
+        except Exception as e:
+            if is_retryable(e) and not isinstance(e, (TypeError, ValueError)):
+                return False # Transient: check by SELECT this time, ask again next time
+            _log_rpc_fallback("inventory_unique_keys", e, "checking duplicates with SELECTs")
+            _inventory_unique_keys = False
+    return _inventory_unique_keys
+
 @retry_db(max_retries=3)
 def add_item(name, category, maker, supplier, color, barcode, quantity, price, min_threshold, sale_percent=0, bogo=False):
     """Add a new item to the inventory."""
@@ -148,16 +336,6 @@ def add_item(name, category, maker, supplier, color, barcode, quantity, price, m
         maker = maker.upper() if maker else maker
         supplier = supplier.upper() if supplier else supplier
 
-        # Check if item exists (by name or barcode)
-        existing = supabase.table("inventory").select("id").eq("name", name).execute()
-        if existing.data:
-            return False, f"Item '{name}' already exists."
-
-        if barcode:
-            existing_bc = supabase.table("inventory").select("id").eq("barcode", barcode).execute()
-            if existing_bc.data:
-                 return False, f"Barcode '{barcode}' already exists."
-
         data = {
             "name": name,
             "category": category,
@@ -172,7 +350,31 @@ def add_item(name, category, maker, supplier, color, barcode, quantity, price, m
             "bogo": bool(bogo)
         }
         
-        response = supabase.table("inventory").insert(data).execute()
+        # Without the unique indexes (see supabase_functions.sql), check by name and barcode first
+        if not inventory_unique_keys_enforced():
+            if not barcode:
+                # Name only: a HEAD request with a count, no row body
+                existing = supabase.table("inventory").select("id", head=True, count="exact").eq("name", name).execute()
+                if existing.count:
+                    return False, f"Item '{name}' already exists."
+            else:
+                # One request for both: at most one row can match each field, and the rows say which
+                filters = f"name.eq.{_pgrst_quote(name)},barcode.eq.{_pgrst_quote(barcode)}"
+                existing = supabase.table("inventory").select("name,barcode").or_(filters).limit(2).execute()
+                if any(row['name'] == name for row in existing.data):
+                    return False, f"Item '{name}' already exists."
+                if existing.data:
+                    return False, f"Barcode '{barcode}' already exists."
+
+        # Duplicate names/barcodes are rejected by the UNIQUE constraints (see supabase_functions.sql)
+        try:
+            response = supabase.table("inventory").insert(data).execute()
+        except Exception as e:
+            if getattr(e, "code", None) != "23505": # unique_violation
+                raise
+            if "barcode" in f"{getattr(e, 'message', '')} {getattr(e, 'details', '')}":
+                return False, f"Barcode '{barcode}' already exists."
+            return False, f"Item '{name}' already exists."
         new_item = response.data[0]
         
         # Log initial stock
@@ -183,27 +385,42 @@ def add_item(name, category, maker, supplier, color, barcode, quantity, price, m
         return False, str(e)
 
 @retry_db(max_retries=3)
-def update_stock(item_id, item_name, change_amount, transaction_type, note="", receipt_id=None, payment_method="CASH"):
-    """Update stock level and log transaction."""
+def update_stock(item_id, item_name, change_amount, transaction_type, note="", receipt_id=None, payment_method="CASH", log=True):
+    """Update stock level and log transaction (log=False leaves logging to the caller)."""
     try:
-        # 1. Get current stock
-        res = supabase.table("inventory").select("quantity").eq("id", item_id).single().execute()
-        if not res.data:
-            return False, "Item not found."
+        try:
+            # 1+2. Conditional UPDATE ... RETURNING in one round-trip, no read-then-write race
+            res = supabase.rpc("atomic_adjust_stock", {"p_item_id": item_id, "p_delta": change_amount}).execute()
+            if res.data is None:
+                return False, f"Insufficient stock for {item_name}."
+            new_qty = int(res.data)
+        except Exception as e:
+            # Fallback: atomic_adjust_stock() not created yet (see supabase_functions.sql)
+            if getattr(e, "code", None) != "PGRST202":
+                return False, getattr(e, "message", None) or str(e)
+            print(f"⚠️ atomic_adjust_stock RPC missing, using select + update: {e}")
             
-        current_qty = res.data['quantity']
-        new_qty = current_qty + change_amount
-        
-        if new_qty < 0:
-            return False, f"Insufficient stock for {item_name}."
+            # 1. Get current stock
+            res = supabase.table("inventory").select("quantity").eq("id", item_id).single().execute()
+            if not res.data:
+                return False, "Item not found."
+                
+            current_qty = res.data['quantity']
+            new_qty = current_qty + change_amount
             
-        # 2. Update Inventory
-        supabase.table("inventory").update({"quantity": new_qty}).eq("id", item_id).execute()
+            if new_qty < 0:
+                return False, f"Insufficient stock for {item_name}."
+                
+            # 2. Update Inventory
+            supabase.table("inventory").update({"quantity": new_qty}).eq("id", item_id).execute()
+        
+        msg = f"Stock updated. New Quantity: {new_qty}"
+        if not log:
+            return True, msg
         
         # 3. Log Transaction
         log_success, log_err = log_transaction(item_id, item_name, transaction_type, abs(change_amount), note, receipt_id, payment_method)
         
-        msg = f"Stock updated. New Quantity: {new_qty}"
         if not log_success:
             msg += f" (⚠️ History Log Failed: {log_err})"
             
@@ -218,7 +435,22 @@ def process_batch_transaction(cart_items, transaction_type="SALE", payment_metho
     """
     try:
         receipt_id = str(uuid.uuid4())
+        
+        try:
+            # One round-trip: stock check, updates and log rows in a single SQL transaction
+            items = [{"id": item['id'], "name": item['name'], "qty": item['qty'], "note": item.get('note', '')} for item in cart_items]
+            supabase.rpc("process_receipt", {"p_receipt_id": receipt_id, "p_type": transaction_type, "p_payment": payment_method, "p_items": items}).execute()
+            return True, receipt_id
+        except Exception as e:
+            # Only fall back when process_receipt() hasn't been created yet (see supabase_functions.sql);
+            # any other error rolled the whole receipt back and must not be retried item by item
+            if getattr(e, "code", None) != "PGRST202":
+                return False, getattr(e, "message", None) or str(e)
+            print(f"⚠️ process_receipt RPC missing, updating items one by one: {e}")
+        
         errors = []
+        log_rows = [] # Logged together after the loop: one insert for the whole receipt
+        timestamp = get_eastern_time().isoformat() # Shared by every line of the receipt
         
         for item in cart_items:
             # Determine change amount (Negative for SALE)
@@ -236,12 +468,18 @@ def process_batch_transaction(cart_items, transaction_type="SALE", payment_metho
                 transaction_type, 
                 item.get('note', ''), 
                 receipt_id,
-                payment_method
+                payment_method,
+                log=False
             )
             
-            if not success:
+            if success:
+                log_rows.append(_log_row(item['id'], item['name'], transaction_type, abs(change), item.get('note', ''), receipt_id, payment_method, timestamp))
+            else:
                 errors.append(f"Failed {item['name']}: {msg}")
         
+        if log_rows:
+            log_transactions(log_rows)
+        
         if errors:
             return False, "Some items failed: " + "; ".join(errors)
             
@@ -279,38 +517,130 @@ def update_item_details(item_id, name, category, maker, supplier, color, barcode
     except Exception as e:
         return False, str(e)
 
-@retry_db(max_retries=3)
-def log_transaction(item_id, item_name, type_, quantity, note, receipt_id=None, payment_method="CASH"):
-    try:
-        data = {
-            "item_id": item_id,
-            "item_name": item_name,
-            "type": type_,
-            "quantity": quantity, # Always positive in log
-            "note": note,
-            "timestamp": get_eastern_time().isoformat(),
-            "receipt_id": receipt_id,
-            "payment_method": payment_method
-        }
-        supabase.table("transactions").insert(data).execute()
-        return True, "Logged"
-    except Exception as e:
-        # If this fails, it is likely because the 'payment_method' or 'receipt_id' columns 
-        # are missing from the Supabase table.
-        print(f"⚠️ Failed to log transaction with payment_method: {e}")
+# --- Transaction Log Queue ---
+# Log rows are history metadata: the inventory change is already committed, so they are
+# written off the request thread and batched into one insert per flush.
+LOG_FLUSH_SECONDS = 0.05
+LOG_BATCH_SIZE = 32
+
+# Flipped off once the transactions table turns out to lack payment_method/receipt_id,
+# so later batches go straight to the reduced insert
+_log_extra_columns_available = True
+
+def _insert_log_rows(rows):
+    """Insert a batch of transaction log rows, without the newer columns if the table lacks them."""
+    global _log_extra_columns_available
+    if _log_extra_columns_available:
         try:
-            # Fallback: Try without the newer columns
+            supabase.table("transactions").insert(rows).execute()
+            return
+        except Exception as e:
+            # Only a missing 'payment_method'/'receipt_id' column is worth a reduced retry
+            if getattr(e, "code", None) not in MISSING_COLUMN_CODES:
+                print(f"CRITICAL: Failed to log {len(rows)} transaction(s): {e}")
+                return
+            print(f"⚠️ transactions table lacks payment_method/receipt_id, logging without them: {e}")
+            _log_extra_columns_available = False
+    try:
+        for data in rows:
             data.pop("payment_method", None)
             data.pop("receipt_id", None)
-            supabase.table("transactions").insert(data).execute()
-            return True, f"Logged (Fallback - Missing DB Column? Error: {e})"
-        except Exception as e2:
-             print(f"CRITICAL: Failed to log transaction (fallback): {e2}")
-             return False, f"Log Failed: {e2}"
+        supabase.table("transactions").insert(rows).execute()
+    except Exception as e2:
+        print(f"CRITICAL: Failed to log {len(rows)} transaction(s) (fallback): {e2}")
+
+# How long interpreter exit waits for queued logs when the DB is slow or unreachable
+LOG_DRAIN_TIMEOUT_SECONDS = 5
+
+# Bumped after every flush so callers can key cached transaction reads on it
+_log_flush_count = 0
+
+def get_log_flush_count():
+    """Number of log batches written so far; changes once queued rows are visible in the table."""
+    return _log_flush_count
+
+def _log_worker(log_queue):
+    """Drain the log queue until the None sentinel, flushing every LOG_FLUSH_SECONDS or LOG_BATCH_SIZE rows."""
+    global _log_flush_count
+    stopping = False
+    while not stopping:
+        # Queue entries are lists of rows (a whole receipt stays in one entry)
+        entry = log_queue.get()
+        if entry is None:
+            return
+        rows = list(entry)
+        deadline = time.monotonic() + LOG_FLUSH_SECONDS
+        while len(rows) < LOG_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                entry = log_queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if entry is None: # Flush what we have, then stop
+                stopping = True
+                break
+            rows.extend(entry)
+        _insert_log_rows(rows)
+        _log_flush_count += 1
+
+def _stop_log_worker(log_queue, worker):
+    """Let the writer flush what is queued, but never hold up exit longer than LOG_DRAIN_TIMEOUT_SECONDS."""
+    log_queue.put(None)
+    worker.join(timeout=LOG_DRAIN_TIMEOUT_SECONDS)
+
+@st.cache_resource
+def get_log_queue():
+    """One log queue and daemon writer thread per server process; drained (bounded) at exit.
+
+    Writes are asynchronous, so a read right after a logged action can miss its rows
+    until the next flush; key cached reads on get_log_flush_count() to pick them up.
+    """
+    log_queue = queue.Queue()
+    worker = threading.Thread(target=_log_worker, args=(log_queue,), daemon=True, name="transaction-log")
+    worker.start()
+    atexit.register(_stop_log_worker, log_queue, worker)
+    return log_queue
+
+def _log_row(item_id, item_name, type_, quantity, note, receipt_id=None, payment_method="CASH", timestamp=None):
+    return {
+        "item_id": item_id,
+        "item_name": item_name,
+        "type": type_,
+        "quantity": quantity, # Always positive in log
+        "note": note,
+        "timestamp": timestamp or get_eastern_time().isoformat(),
+        "receipt_id": receipt_id,
+        "payment_method": payment_method
+    }
+
+def log_transactions(rows):
+    """Queue several transaction log rows to be written in the same insert."""
+    try:
+        get_log_queue().put_nowait(list(rows))
+        return True, "Logged (queued)"
+    except Exception as e:
+        print(f"CRITICAL: Failed to queue transaction log: {e}")
+        return False, f"Log Failed: {e}"
+
+def log_transaction(item_id, item_name, type_, quantity, note, receipt_id=None, payment_method="CASH", timestamp=None):
+    """Queue a transaction log row for the background writer (timestamp defaults to now)."""
+    return log_transactions([_log_row(item_id, item_name, type_, quantity, note, receipt_id, payment_method, timestamp)])
 
 def delete_item(item_id):
     """Delete item while preserving its transaction history."""
     try:
+        try:
+            # Detach history and delete the item in one round-trip and one SQL transaction
+            supabase.rpc("delete_item_keep_history", {"p_item_id": item_id}).execute()
+            return True, "Item removed (history preserved)."
+        except Exception as e:
+            # Fallback: delete_item_keep_history() not created yet (see supabase_functions.sql)
+            if getattr(e, "code", None) != "PGRST202":
+                return False, getattr(e, "message", None) or str(e)
+            print(f"⚠️ delete_item_keep_history RPC missing, using two requests: {e}")
+        
         # Decouple transactions from this item before deletion
         # This keeps the history alive (item_name is already stored as text in transactions)
         supabase.table("transactions").update({"item_id": None}).eq("item_id", item_id).execute()
@@ -324,7 +654,8 @@ def delete_item(item_id):
 def get_top_selling_items(period="week", limit=10):
     """
     Get top selling items.
-    For this MVP, we'll fetch sales and process in Python, or use a simple query.
+    Aggregated in Postgres by the top_selling() RPC; if that function hasn't been
+    created yet, we fetch sales and process in Python.
     """
     try:
         if period == "week":
@@ -334,9 +665,17 @@ def get_top_selling_items(period="week", limit=10):
         else:
             start_date = (get_eastern_time() - timedelta(days=3650)).isoformat()
 
-        # Fetch sales
-        # To do this efficiently in Supabase/PostgREST without a stored proc is tricky for aggregation.
-        # We will fetch raw sales rows and aggregate in Pandas for now (fast enough for <10k rows).
+        try:
+            # Only `limit` pre-aggregated rows come back over the wire
+            response = supabase.rpc("top_selling", {"p_start": start_date, "p_limit": limit}).execute()
+            if not response.data:
+                return pd.DataFrame()
+            return pd.DataFrame(response.data).rename(columns={'item_name': 'Item Name', 'total_sold': 'Total Sold', 'revenue': 'Revenue'})
+        except Exception as e:
+            # Fallback: top_selling() not created yet (see supabase_functions.sql)
+            print(f"⚠️ top_selling RPC failed, aggregating client-side: {e}")
+
+        # Fetch raw sales rows and aggregate in Pandas (fast enough for <10k rows).
         
         response = supabase.table("transactions")\
             .select("item_name, quantity, item_id")\
@@ -349,34 +688,56 @@ def get_top_selling_items(period="week", limit=10):
             return pd.DataFrame()
             
         df = pd.DataFrame(sales)
+        df['item_id'] = df['item_id'].astype('Int64') # Nullable: deleted items keep their history with no id
+        df['quantity'] = df['quantity'].astype('int32')
+        # Categorical key: groupby hashes small integer codes instead of Python strings
+        df['item_name'] = df['item_name'].astype('category')
         
         # We also need price to calculate revenue
         # Fetch inventory prices (simplified: fetch all prices)
         inv_res = supabase.table("inventory").select("id, price").execute()
-        inv_map = {row['id']: row['price'] for row in inv_res.data}
+        prices = pd.DataFrame(inv_res.data or [], columns=['id', 'price']).rename(columns={'id': 'item_id'})
+        prices = prices.astype({'item_id': 'Int64', 'price': 'float64'})
         
-        df['price'] = df['item_id'].map(inv_map).fillna(0)
+        # Hash join in pandas instead of a Python dict lookup per sales row
+        df = df.merge(prices, on='item_id', how='left')
+        df['price'] = df['price'].fillna(0)
         df['revenue'] = df['quantity'] * df['price']
         
-        grouped = df.groupby('item_name').agg({
-            'quantity': 'sum',
-            'revenue': 'sum'
-        }).reset_index()
+        # Named aggregation + partial selection of the top `limit` (no full sort, no rename pass)
+        grouped = df.groupby('item_name', observed=True, sort=False).agg(**{
+            'Total Sold': ('quantity', 'sum'),
+            'Revenue': ('revenue', 'sum')
+        }).nlargest(limit, 'Total Sold')
         
-        grouped = grouped.rename(columns={'quantity': 'Total Sold', 'revenue': 'Revenue', 'item_name': 'Item Name'})
-        grouped = grouped.sort_values(by='Total Sold', ascending=False).head(limit)
-        
-        return grouped
+        return grouped.rename_axis('Item Name').reset_index()
         
     except Exception as e:
         print(f"Error getting top items: {e}")
         return pd.DataFrame()
 
 # --- Customer Display / Realtime Sync ---
-def update_live_cart(cart_data):
+# orjson (de)serializes the live cart several times faster; the stdlib is the fallback
+try:
+    import orjson
+
+    def json_dumps(obj):
+        return orjson.dumps(obj, default=str).decode()
+
+    json_loads = orjson.loads
+except ImportError:
+    def json_dumps(obj):
+        return json.dumps(obj, default=str)
+
+    json_loads = json.loads
+
+# Rapid cart changes (scans, discount edits) are coalesced: the first change arms a
+# LIVE_CART_DELAY_SECONDS timer and only the latest cart is written when it fires.
+LIVE_CART_DELAY_SECONDS = 0.25
+LIVE_CART_POLL_SECONDS = 0.05
+
+def _write_live_cart(json_str):
     try:
-        import json
-        json_str = json.dumps(cart_data)
         # Reuse existing set_setting function
         supabase.table('system_settings').upsert({'key': 'live_cart_data', 'value': json_str}).execute()
         return True
@@ -384,16 +745,60 @@ def update_live_cart(cart_data):
         print(f'Failed to update live cart: {e}')
         return False
 
+def _live_cart_flusher(state):
+    """Write the pending live cart once its deadline passes."""
+    while True:
+        time.sleep(LIVE_CART_POLL_SECONDS)
+        with state["write_lock"]:
+            with state["lock"]:
+                if state["pending"] is None or time.monotonic() < state["due"]:
+                    continue
+                json_str, state["pending"] = state["pending"], None
+            _write_live_cart(json_str)
+
+@st.cache_resource
+def get_live_cart_scheduler():
+    """Pending live cart state and its daemon flusher thread, one per server process."""
+    state = {"lock": threading.Lock(), "write_lock": threading.Lock(), "pending": None, "due": 0.0}
+    threading.Thread(target=_live_cart_flusher, args=(state,), daemon=True, name="live-cart-sync").start()
+    return state
+
+def schedule_live_cart(cart_data):
+    """Queue a live cart write; changes within LIVE_CART_DELAY_SECONDS collapse into one."""
+    try:
+        json_str = json_dumps(cart_data)
+        state = get_live_cart_scheduler()
+        with state["lock"]:
+            if state["pending"] is None:
+                state["due"] = time.monotonic() + LIVE_CART_DELAY_SECONDS
+            state["pending"] = json_str
+        return True
+    except Exception as e:
+        print(f'Failed to schedule live cart: {e}')
+        return False
+
+def update_live_cart(cart_data):
+    """Write the live cart now, superseding any scheduled write."""
+    try:
+        json_str = json_dumps(cart_data)
+        state = get_live_cart_scheduler()
+        with state["write_lock"]:
+            with state["lock"]:
+                state["pending"] = None
+            return _write_live_cart(json_str)
+    except Exception as e:
+        print(f'Failed to update live cart: {e}')
+        return False
+
 def get_live_cart():
     try:
-        import json
         res = supabase.table('system_settings').select('value').eq('key', 'live_cart_data').single().execute()
         if not res.data:
             return None
         val = res.data['value']
         if not val:
             return None
-        return json.loads(val)
+        return json_loads(val)
     except Exception as e:
         print(f'Failed to get live cart: {e}')
         return None
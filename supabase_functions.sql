@@ -0,0 +1,192 @@
+-- Postgres functions used by backend.py via supabase.rpc(...).
+-- Run this in the Supabase SQL editor. If a function is missing, backend.py
+-- falls back to fetching the rows and computing the result in Python.
+
+-- Dashboard metrics: item count and total stock in one row.
+create or replace function inventory_stats()
+returns table (total_items bigint, total_stock bigint)
+language sql stable
+as $$
+    select count(*), coalesce(sum(quantity), 0) from inventory;
+$$;
+
+-- Dashboard low stock alert: only the rows at or below their threshold.
+create or replace function low_stock_items()
+returns setof inventory
+language sql stable
+as $$
+    select * from inventory where quantity <= min_threshold order by id;
+$$;
+
+-- Inventory (Admin) page: total stock value as a single number.
+create or replace function inventory_total_value()
+returns numeric
+language sql stable
+as $$
+    select coalesce(sum(quantity * price), 0) from inventory;
+$$;
+
+-- Top selling items since p_start, aggregated server-side so only p_limit rows
+-- are returned. Items deleted from inventory count with a price of 0.
+create or replace function top_selling(p_start timestamptz, p_limit int)
+returns table (item_name text, total_sold bigint, revenue numeric)
+language sql stable
+as $$
+    select t.item_name,
+           sum(t.quantity) as total_sold,
+           sum(t.quantity * coalesce(i.price, 0)) as revenue
+    from transactions t
+    left join inventory i on i.id = t.item_id
+    where t.type = 'SALE' and t.timestamp >= p_start
+    group by t.item_name
+    order by total_sold desc
+    limit p_limit;
+$$;
+
+-- Inventory change counter. A statement-level trigger bumps it on every write
+-- to inventory, so the POS page can skip refetching when nothing has changed.
+create table if not exists inventory_version (
+    id int primary key default 1 check (id = 1),
+    version bigint not null default 0
+);
+insert into inventory_version (id, version) values (1, 0) on conflict do nothing;
+
+create or replace function bump_inventory_version()
+returns trigger
+language plpgsql security definer
+set search_path = public
+as $$
+begin
+    update public.inventory_version set version = version + 1 where id = 1;
+    return null;
+end;
+$$;
+
+drop trigger if exists inventory_version_bump on inventory;
+create trigger inventory_version_bump
+after insert or update or delete on inventory
+for each statement execute function bump_inventory_version();
+
+create or replace function inventory_version()
+returns bigint
+language sql stable
+as $$
+    select version from inventory_version where id = 1;
+$$;
+
+
+-- Checkout: apply a whole receipt in one round-trip and one SQL transaction.
+-- p_items is the cart as a JSON array of {id, name, qty, note}. SALE subtracts
+-- stock, every other type adds it. Rows are locked before the stock check, so
+-- concurrent checkouts cannot oversell, and any error rolls back the receipt.
+create or replace function process_receipt(p_receipt_id uuid, p_type text, p_payment text, p_items jsonb)
+returns void
+language plpgsql
+as $$
+declare
+    v_missing bigint;
+    v_short text;
+begin
+    perform 1 from inventory
+    where id in (select (e->>'id')::bigint from jsonb_array_elements(p_items) e)
+    order by id
+    for update;
+
+    select it.id into v_missing
+    from jsonb_to_recordset(p_items) as it(id bigint)
+    left join inventory i on i.id = it.id
+    where i.id is null
+    limit 1;
+    if v_missing is not null then
+        raise exception 'Item not found: %', v_missing;
+    end if;
+
+    if p_type = 'SALE' then
+        select string_agg(i.name, ', ') into v_short
+        from (select id, sum(qty) as qty from jsonb_to_recordset(p_items) as x(id bigint, qty int) group by id) it
+        join inventory i on i.id = it.id
+        where i.quantity < it.qty;
+        if v_short is not null then
+            raise exception 'Insufficient stock for %.', v_short;
+        end if;
+    end if;
+
+    update inventory i
+    set quantity = i.quantity + case when p_type = 'SALE' then -it.qty else it.qty end
+    from (select id, sum(qty) as qty from jsonb_to_recordset(p_items) as x(id bigint, qty int) group by id) it
+    where i.id = it.id;
+
+    insert into transactions (item_id, item_name, type, quantity, note, timestamp, receipt_id, payment_method)
+    select x.id, x.name, p_type, x.qty, coalesce(x.note, ''), now(), p_receipt_id, p_payment
+    from jsonb_to_recordset(p_items) as x(id bigint, name text, qty int, note text);
+end;
+$$;
+
+-- Single-item stock change: one conditional UPDATE ... RETURNING instead of a
+-- SELECT followed by an UPDATE. Returns the new quantity, or null when the
+-- change would take stock below zero.
+create or replace function atomic_adjust_stock(p_item_id bigint, p_delta int)
+returns int
+language plpgsql
+as $$
+declare
+    v_qty int;
+begin
+    update inventory set quantity = quantity + p_delta
+    where id = p_item_id and quantity + p_delta >= 0
+    returning quantity into v_qty;
+    if not found and not exists (select 1 from inventory where id = p_item_id) then
+        raise exception 'Item not found.';
+    end if;
+    return v_qty;
+end;
+$$;
+
+-- Item names and barcodes are unique. Once both indexes exist add_item inserts
+-- directly and reports the unique_violation (23505) instead of checking with
+-- two SELECTs first. Empty barcodes are stored as null and left out of the
+-- barcode index. If existing rows already collide the index is skipped with a
+-- notice (add_item keeps its SELECT checks); merge the duplicates and re-run.
+do $$
+begin
+    if exists (select 1 from inventory group by name having count(*) > 1) then
+        raise notice 'inventory_name_key skipped: duplicate item names exist';
+    else
+        create unique index if not exists inventory_name_key on inventory (name);
+    end if;
+    if exists (select 1 from inventory where barcode is not null group by barcode having count(*) > 1) then
+        raise notice 'inventory_barcode_key skipped: duplicate barcodes exist';
+    else
+        create unique index if not exists inventory_barcode_key on inventory (barcode) where barcode is not null;
+    end if;
+end;
+$$;
+
+-- Lets add_item ask once whether both unique indexes are in place.
+create or replace function inventory_unique_keys()
+returns boolean
+language sql
+stable
+as $$
+    select count(*) = 2 from pg_indexes
+    where schemaname = 'public' and tablename = 'inventory' and indexname in ('inventory_name_key', 'inventory_barcode_key');
+$$;
+
+-- Speeds up the SALE + timestamp range scan behind top_selling().
+create index if not exists transactions_type_timestamp_idx on transactions (type, timestamp);
+
+-- Item deletion: detach the item's transactions (item_name stays as text, so
+-- history is preserved) and delete the item atomically in one round-trip.
+create or replace function delete_item_keep_history(p_item_id bigint)
+returns void
+language plpgsql
+as $$
+begin
+    update transactions set item_id = null where item_id = p_item_id;
+    delete from inventory where id = p_item_id;
+end;
+$$;
+
+-- History page: newest-first pages read the index in order instead of
+-- sorting the whole transactions table.
+create index if not exists transactions_timestamp_desc_idx on transactions (timestamp desc);